@@ -1,15 +1,72 @@
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
 from .version import __version__  # noqa: W0611
 
 from .exceptions import (  # noqa: W0611
     TestImportsError, TestImportsRevertError, TestImportsPatchingError,
     TestImportsPatchedError, TestImportsUnpatchedError,
 )
-from .interfaces import fail_imports, mock_imports  # noqa: W0611
-from .states import BootstrapState, BootstrapStates  # noqa: W0611
-from .types import (  # noqa: W0611
-    T_module, T_input_module, T_input_modules, T_input_hide_module,
-    T_input_hide_modules, T_input_modules_mapping, T_modules_sequence,
-    T_modules_mapping, T_exception, T_import_vars, T_import, T_find_and_load,
-    T_handle_fromlist,
-)
-from .worker import TestImportsWorker  # noqa: W0611
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .interfaces import fail_imports, mock_imports  # noqa: W0611
+    from .states import BootstrapState, BootstrapStates  # noqa: W0611
+    from .types import (  # noqa: W0611
+        T_module, T_input_module, T_input_modules, T_input_hide_module,
+        T_input_hide_modules, T_input_modules_mapping, T_modules_sequence,
+        T_modules_mapping, T_exception, T_import_vars, T_import,
+        T_find_and_load, T_handle_fromlist,
+    )
+    from .worker import TestImportsWorker  # noqa: W0611
+
+
+# Names that are imported from their submodules only when first used (see PEP
+# 562), so that importing this package doesn't load the whole worker machinery.
+_LAZY_NAMES = {
+    "fail_imports": "interfaces",
+    "mock_imports": "interfaces",
+    "BootstrapState": "states",
+    "BootstrapStates": "states",
+    "T_module": "types",
+    "T_input_module": "types",
+    "T_input_modules": "types",
+    "T_input_hide_module": "types",
+    "T_input_hide_modules": "types",
+    "T_input_modules_mapping": "types",
+    "T_modules_sequence": "types",
+    "T_modules_mapping": "types",
+    "T_exception": "types",
+    "T_import_vars": "types",
+    "T_import": "types",
+    "T_find_and_load": "types",
+    "T_handle_fromlist": "types",
+    "TestImportsWorker": "worker",
+}
+
+__all__ = [
+    "TestImportsError", "TestImportsRevertError", "TestImportsPatchingError",
+    "TestImportsPatchedError", "TestImportsUnpatchedError",
+    *_LAZY_NAMES,
+]
+
+
+def __getattr__(name: str) -> Any:
+    """
+    Import lazily loaded `name` from its submodule and cache it.
+    """
+    try:
+        module_name = _LAZY_NAMES[name]
+    except KeyError:
+        raise AttributeError(
+            f"module {__name__!r} has no attribute {name!r}",
+        ) from None
+    value = getattr(import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    """
+    Return the names in this module, including the lazily loaded ones.
+    """
+    return sorted(set(globals()) | set(_LAZY_NAMES))
@@ -2,13 +2,17 @@
 Class for holding the states of `_find_and_load` and `_handle_fromlist`.
 """
 
+from collections.abc import Iterator
+from contextlib import contextmanager
 import importlib._bootstrap  # type: ignore
 import sys
+import threading
 from types import ModuleType
-from typing import Sequence, Pattern, Final
+from typing import AbstractSet, Sequence, Pattern, Final
 
 from .exceptions import TestImportsRevertError
 from .types import T_find_and_load, T_handle_fromlist
+from .utils import combine_patterns, pattern_to_literal
 
 
 class BootstrapState:
@@ -16,11 +20,29 @@ class BootstrapState:
     Class for holding the states of `_find_and_load` and `_handle_fromlist`.
     """
 
+    __slots__ = (
+        "_active", "original_find_and_load", "original_handle_fromlist",
+        "_module_regexes", "_literal_names", "_regex_patterns",
+        "_combined_regex", "_hidden_modules", "_known_matching", "__weakref__",
+    )
+
     def __init__(self, module_regexes: Sequence[Pattern]) -> None:
         self._active = True
         self.original_find_and_load = importlib._bootstrap._find_and_load
         self.original_handle_fromlist = importlib._bootstrap._handle_fromlist
         self._module_regexes = module_regexes
+        # Regexes matching just one name are checked with set operations.
+        literal_names: set[str] = set()
+        regex_patterns: list[Pattern] = list()
+        for regex in module_regexes:
+            literal_name = pattern_to_literal(regex)
+            if literal_name is None:
+                regex_patterns.append(regex)
+            else:
+                literal_names.add(literal_name)
+        self._literal_names = frozenset(literal_names)
+        self._regex_patterns = tuple(regex_patterns)
+        self._combined_regex = combine_patterns(self._regex_patterns)
         self._hidden_modules: dict[str, ModuleType] = dict()
         # Add removal of modules not in _hidden_modules when unpatching!
         self._hide_modules()
@@ -40,14 +62,37 @@ class BootstrapState:
         """
         return module_name in self._hidden_modules
 
-    def _get_matching_modules(self) -> set[str]:
+    def _matches(self, module_name: str) -> bool:
+        """
+        Return `True` if `module_name` matches some of `_module_regexes`.
+        """
+        if module_name in self._literal_names:
+            return True
+        if self._combined_regex is None:
+            return any(
+                regex.match(module_name) for regex in self._regex_patterns
+            )
+        return self._combined_regex.match(module_name) is not None
+
+    def _get_matching_modules(self) -> AbstractSet[str]:
         """
         Return a set of names in `sys.modules` matching some `_module_regexes`.
         """
-        return {
+        result = self._literal_names & sys.modules.keys()
+        if not self._regex_patterns:
+            return result
+        if self._combined_regex is None:
+            regex_patterns = self._regex_patterns
+            return result | {
+                module_name
+                for module_name in list(sys.modules)
+                if any(regex.match(module_name) for regex in regex_patterns)
+            }
+        match = self._combined_regex.match
+        return result | {
             module_name
-            for module_name in sys.modules
-            if any(regex.match(module_name) for regex in self._module_regexes)
+            for module_name in list(sys.modules)
+            if match(module_name)
         }
 
     def _hide_modules(self) -> None:
@@ -56,13 +101,29 @@ class BootstrapState:
         """
         for module_name in self._get_matching_modules():
             self._hidden_modules[module_name] = sys.modules.pop(module_name)
+        self._known_matching: set[str] = set(self._hidden_modules)
+
+    def track_module(self, module_name: str) -> None:
+        """
+        Remember `module_name` if it matches some of `_module_regexes`.
+
+        The patched import functions call this for the modules they load, so
+        that :py:meth:`revert` can unload them without scanning `sys.modules`.
+        """
+        if self._matches(module_name):
+            self._known_matching.add(module_name)
 
     def _unload_matching_modules(self) -> None:
         """
         Remove modules matching `self._module_regexes` from `sys.modules`.
+
+        Only the modules loaded while this state was active are removed (see
+        :py:meth:`track_module`). Hidden modules are skipped because they are
+        put back on revert anyway.
         """
-        for module_name in self._get_matching_modules():
-            sys.modules.pop(module_name)
+        modules = sys.modules
+        for module_name in self._known_matching - self._hidden_modules.keys():
+            modules.pop(module_name, None)
 
     def revert(self) -> None:
         """
@@ -92,6 +153,11 @@ class BootstrapStates:
     """
 
     _states: Final[list[BootstrapState]] = list()
+    # Maps `id(state)` to the index of `state` in `_states`.
+    _state_positions: Final[dict[int, int]] = dict()
+    # The patched functions are global for the whole process, so the states
+    # are too, but the changes of their stack are serialized between threads.
+    _lock: Final = threading.RLock()
     _original_find_and_load = importlib._bootstrap._find_and_load
     _original_handle_fromlist = importlib._bootstrap._handle_fromlist
 
@@ -105,10 +171,12 @@ class BootstrapStates:
         """
         Patch `importlib._bootstrap.*` functions and return bootstrap state.
         """
-        result = BootstrapState(module_regexes)
-        cls._states.append(result)
-        importlib._bootstrap._find_and_load = patch_find_and_load
-        importlib._bootstrap._handle_fromlist = patch_handle_fromlist
+        with cls._lock:
+            result = BootstrapState(module_regexes)
+            cls._state_positions[id(result)] = len(cls._states)
+            cls._states.append(result)
+            importlib._bootstrap._find_and_load = patch_find_and_load
+            importlib._bootstrap._handle_fromlist = patch_handle_fromlist
         return result
 
     @classmethod
@@ -116,21 +184,62 @@ class BootstrapStates:
         """
         Undo patches from `state` to the last one.
         """
-        try:
-            index = 0 if state is None else cls._states.index(state)
-        except ValueError:
-            pass
-        else:
-            for st in reversed(cls._states[index:]):
+        with cls._lock:
+            states = cls._states
+            positions = cls._state_positions
+            if state is None:
+                index = 0
+            else:
+                index = positions.get(id(state), -1)
+                if not (0 <= index < len(states) and states[index] is state):
+                    # The positions are stale (`_states` was changed directly).
+                    try:
+                        index = states.index(state)
+                    except ValueError:
+                        return
+            for st in reversed(states[index:]):
+                positions.pop(id(st), None)
                 if st._active:
                     st.revert()
-            del cls._states[index:]
+            del states[index:]
 
     @classmethod
     def clear(cls) -> None:
         """
         Undo all the patches done since the creation of this class.
         """
-        cls.unpatch()
-        importlib._bootstrap._find_and_load = cls._original_find_and_load
-        importlib._bootstrap._handle_fromlist = cls._original_handle_fromlist
+        with cls._lock:
+            cls.unpatch()
+            importlib._bootstrap._find_and_load = cls._original_find_and_load
+            importlib._bootstrap._handle_fromlist = (
+                cls._original_handle_fromlist
+            )
+
+    @classmethod
+    @contextmanager
+    def _scoped_states(
+        cls, states: Sequence[BootstrapState],
+    ) -> Iterator[None]:
+        """
+        Return context manager that temporarily replaces the stack of states.
+
+        The stack is set to `states` on entering and the original one is put
+        back on exiting, even if an exception was raised. The states are not
+        patched or reverted, so this is meant only for testing the stack
+        handling itself.
+        """
+        with cls._lock:
+            saved_states = cls._states[:]
+            saved_positions = cls._state_positions.copy()
+            cls._states[:] = states
+            cls._state_positions.clear()
+            cls._state_positions.update(
+                (id(state), index) for index, state in enumerate(states)
+            )
+        try:
+            yield
+        finally:
+            with cls._lock:
+                cls._states[:] = saved_states
+                cls._state_positions.clear()
+                cls._state_positions.update(saved_positions)
@@ -2,7 +2,8 @@
 Utility functions.
 """
 
-from collections.abc import Sequence, Mapping
+from collections.abc import Sequence, Mapping, Callable
+from functools import lru_cache
 import re
 from types import ModuleType
 from typing import Type, NoReturn, Pattern, Any, cast
@@ -13,6 +14,22 @@ from .types import (
 )
 
 
+# Flags that can be applied to a part of a regex, with their inline letters.
+_INLINE_FLAGS = (
+    (re.IGNORECASE, "i"),
+    (re.MULTILINE, "m"),
+    (re.DOTALL, "s"),
+    (re.VERBOSE, "x"),
+)
+
+# Types accepted as hidden modules and as substitutes, respectively.
+_HIDE_TYPES = (Pattern, str, ModuleType)
+_SUB_TYPES = (ModuleType, str)
+
+# Backslash-escaped characters, as produced by `re.escape`.
+_RE_UNESCAPE = re.compile(r"\\(.)", re.DOTALL)
+
+
 def check_exception(exception: T_exception) -> None:
     """
     Raise `TypeError` if `exception` is not an exception instance or class.
@@ -47,6 +64,27 @@ def raise_exception(
     raise exc
 
 
+def get_exception_factory(
+    exception: Exception | Type[Exception],
+) -> Callable[[str], Exception]:
+    """
+    Return a function that takes a message and returns exception to be raised.
+
+    This does the checks from :py:func:`raise_exception` once, so that the
+    returned function can be used as `raise factory(message)` without them.
+
+    :param exception: Exception class or instance to be raised. If it's an
+        instance, the returned function ignores the message and returns it.
+    """
+    if isinstance(exception, Exception):
+        exc = exception
+        return lambda message: exc
+    elif issubclass(exception, Exception):
+        return exception
+    else:
+        raise TypeError("exception must be an exception class or instance")
+
+
 def normalize_name(name: T_input_module | T_input_hide_module) -> Pattern:
     """
     Return normalized `name` to be used as a matching regex for a module name.
@@ -76,14 +114,26 @@ def normalize_name(name: T_input_module | T_input_hide_module) -> Pattern:
         name = name.__name__
 
     if isinstance(name, str):
-        regex = ".*".join(re.escape(s) for s in name.split("*")) + "$"
-        return re.compile(regex)
+        return _str_to_regex(name)
     else:
         raise TypeError(
             "name must be a compiled regex expression or a string",
         )
 
 
+@lru_cache(maxsize=1024)
+def _str_to_regex(name: str) -> Pattern:
+    """
+    Return string `name` converted to a compiled regex.
+
+    This is the cached part of :py:func:`normalize_name`, as the same names
+    tend to be used over and over again in tests.
+    """
+    regex = ".*".join(re.escape(s) for s in name.split("*")) + "$"
+    return re.compile(regex)
+
+
+@lru_cache(maxsize=1024)
 def str_to_pattern(name: str, *, dot: str) -> Pattern:
     """
     Return `name` converted to a compiled regex matching that name.
@@ -94,6 +144,70 @@ def str_to_pattern(name: str, *, dot: str) -> Pattern:
     return normalize_name(name.replace(dot, "."))
 
 
+def pattern_to_literal(pattern: Pattern) -> str | None:
+    """
+    Return the only name that `pattern` matches or `None` if it's not literal.
+
+    A pattern is considered literal if it is an escaped string followed by the
+    end anchor `$`, as created by :py:func:`normalize_name` from names without
+    `"*"`. Such a pattern matches (with its `match` method) only that string,
+    so checking names against it can be done with a simple set lookup.
+    """
+    regex = pattern.pattern
+    if (
+        not isinstance(regex, str)
+        or pattern.flags != re.UNICODE
+        or not regex.endswith("$")
+    ):
+        return None
+    escaped = regex[:-1]
+    name = _RE_UNESCAPE.sub(r"\1", escaped)
+    return name if name and re.escape(name) == escaped else None
+
+
+def combine_patterns(
+    patterns: Sequence[Pattern], *, capture: bool = False,
+) -> Pattern | None:
+    """
+    Return a single compiled regex that matches wherever any of `patterns` do.
+
+    Matching a name against the result (with its `match` method) is equivalent
+    to `any(regex.match(name) for regex in patterns)`, but it takes a single
+    call into the regex engine instead of one per pattern.
+
+    If `capture` is `True`, each of `patterns` is wrapped in a capturing group,
+    so `match.lastindex - 1` is the index of the first pattern that matched.
+
+    `None` is returned if `patterns` is empty or if they cannot be merged
+    safely, i.e., if any of them is a bytes pattern, contains groups (which
+    would be renumbered in the merged regex), or uses flags that cannot be
+    applied to just a part of a regex.
+    """
+    parts: list[str] = list()
+    for pattern in patterns:
+        if not isinstance(pattern.pattern, str) or pattern.groups:
+            return None
+        flags = pattern.flags & ~re.UNICODE
+        letters = ""
+        for flag, letter in _INLINE_FLAGS:
+            if flags & flag:
+                letters += letter
+                flags &= ~flag
+        if flags:
+            return None
+        part = f"(?{letters}:{pattern.pattern})"
+        parts.append(f"({part})" if capture else part)
+
+    if not parts:
+        return None
+    try:
+        return re.compile("|".join(parts))
+    except re.error:
+        # For example, global inline flags (`"(?i)foo"`) are only allowed at
+        # the very start of a regex.
+        return None
+
+
 def pop_hide_modules(
     prefix: str, kwargs: dict[str, Any],
 ) -> T_input_hide_modules:
@@ -102,15 +216,12 @@ def pop_hide_modules(
 
     This is an auxiliary function, used in :py:func:`interfaces.mock_imports`.
     """
-    hide_modules_raw = kwargs.pop(f"{prefix}hide_modules", list())
-    if isinstance(hide_modules_raw, (str, Pattern, ModuleType)):
+    hide_modules_raw = kwargs.pop(f"{prefix}hide_modules", tuple())
+    if isinstance(hide_modules_raw, _HIDE_TYPES):
         return (hide_modules_raw,)
     elif (
         isinstance(hide_modules_raw, Sequence)
-        and all(
-            isinstance(value, Pattern | str | ModuleType)
-            for value in hide_modules_raw
-        )
+        and all(isinstance(value, _HIDE_TYPES) for value in hide_modules_raw)
     ):
         return cast(T_input_hide_modules, hide_modules_raw)
     else:
@@ -158,9 +269,7 @@ def kwargs_to_sub_modules(
     """
     if (
         isinstance(kwargs, Mapping)
-        and all(
-            isinstance(value, ModuleType | str) for value in kwargs.values()
-        )
+        and all(isinstance(value, _SUB_TYPES) for value in kwargs.values())
     ):
         return cast(
             T_modules_mapping,
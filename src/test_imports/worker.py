@@ -2,31 +2,45 @@
 The main class for imports testing.
 """
 
-from collections.abc import Sequence
-from contextlib import ContextDecorator
+from collections.abc import Sequence, Callable
+import copy
+from functools import wraps
 import sys
 from types import ModuleType, TracebackType
-from typing import Type, cast, Generator, Self, Any
+from typing import Type, cast, Generator, Self, Any, ParamSpec, TypeVar
 
 from .exceptions import (
     TestImportsPatchedError, TestImportsUnpatchedError,
 )
 from .states import BootstrapState, BootstrapStates
 from .types import (
-    T_import, T_input_modules, T_input_hide_modules, T_input_modules_mapping,
-    T_modules_sequence, T_modules_mapping,
+    T_module, T_import, T_find_and_load, T_input_modules,
+    T_input_hide_modules, T_input_modules_mapping, T_modules_sequence,
+    T_modules_mapping,
+)
+from .utils import (
+    check_exception, get_exception_factory, normalize_name, combine_patterns,
 )
-from .utils import check_exception, raise_exception, normalize_name
 
 
 _UNDEF = object()
 
+P = ParamSpec("P")
+R = TypeVar("R")
+
 
-class TestImportsWorker(ContextDecorator):
+class TestImportsWorker:
     """
     The main class for imports testing.
     """
 
+    __slots__ = (
+        "_created", "fail_modules", "sub_modules", "_sub_patterns",
+        "_sub_names", "_fail_re", "_sub_re", "hide_modules", "fail_exception",
+        "_make_fail_exception", "sub_module_reload", "_has_subs", "_state",
+        "_name_parts_cache", "debug", "__weakref__",
+    )
+
     def __init__(
         self,
         *,
@@ -46,22 +60,37 @@ class TestImportsWorker(ContextDecorator):
         self.sub_modules: T_modules_mapping = self._normalize_mapping(
             sub_modules,
         )
+        # Substitution rules as two parallel tuples: regexes and the names of
+        # the modules to load instead of the ones that match them.
+        self._sub_patterns = tuple(self.sub_modules)
+        self._sub_names = tuple(
+            self._get_module_name(module)
+            for module in self.sub_modules.values()
+        )
+        self._fail_re = combine_patterns(self.fail_modules)
+        self._sub_re = combine_patterns(self._sub_patterns, capture=True)
         self.hide_modules: T_modules_sequence = self._normalize_sequence(
             hide_modules,
         )
         check_exception(fail_exception)
         self.fail_exception = cast(Exception | Type[Exception], fail_exception)
+        self._make_fail_exception = get_exception_factory(self.fail_exception)
         self.sub_module_reload = sub_module_reload
+        self._has_subs = bool(self.sub_modules)
         self._state: BootstrapState | None = None
+        self._name_parts_cache: dict[str, tuple[str, str]] = dict()
         self.debug = debug
         self._created = True
 
-    def _debug(self, *args: Any) -> None:
+    def _debug(self, fmt: str, *args: Any) -> None:
         """
-        Print `args` if `self.debug` is `True`.
+        Print `fmt % args` if `self.debug` is `True`.
+
+        The message is only formatted when it's actually printed. Hot paths
+        should also check `self.debug` before calling this, to avoid the call.
         """
         if self.debug:
-            print("DEBUG:", *args)
+            print("DEBUG:", fmt % args)
 
     @classmethod
     def _normalize_sequence(
@@ -94,34 +123,56 @@ class TestImportsWorker(ContextDecorator):
                 for key, value in modules_mapping.items()
             }
 
+    @classmethod
+    def _get_module_name(cls, module: T_module) -> str:
+        """
+        Return the name of `module`, given either as a name or as a module.
+        """
+        if isinstance(module, str):
+            return module
+        elif isinstance(module, ModuleType):
+            return module.__name__
+        else:
+            raise TypeError(
+                f"substitute mappings can only be strings and modules (not"
+                f" {module!r})",
+            )
+
     def is_fail_match(self, name: str) -> bool:
         """
         Return `True` if `name` matches any of `self.fail_modules`.
         """
+        if self._fail_re is not None:
+            return self._fail_re.match(name) is not None
         return any(regex.match(name) for regex in self.fail_modules)
 
     def get_sub_match(self, name: str) -> str:
         """
         Return the name of the module that should be loaded instead of `name`.
         """
+        if self._sub_re is not None:
+            match = self._sub_re.match(name)
+            if match is None:
+                return name
+            return self._sub_names[cast(int, match.lastindex) - 1]
+        for index, regex in enumerate(self._sub_patterns):
+            if regex.match(name):
+                return self._sub_names[index]
+        return name
+
+    def _split_name(self, name: str) -> tuple[str, str]:
+        """
+        Return a pair of the parent's name and the last part of `name`.
+
+        The results are cached, as the same (substituted) names are split over
+        and over again.
+        """
         try:
-            substitute = next(
-                substitute
-                for regex, substitute in self.sub_modules.items()
-                if regex.match(name)
-            )
-        except StopIteration:
-            return name
-        else:
-            if isinstance(substitute, str):
-                return substitute
-            elif isinstance(substitute, ModuleType):
-                return substitute.__name__
-            else:
-                raise TypeError(
-                    f"substitute mappings can only be strings and modules (not"
-                    f" {substitute!r}",
-                )
+            return self._name_parts_cache[name]
+        except KeyError:
+            parent_name, _, module_name = name.rpartition(".")
+            result = self._name_parts_cache[name] = (parent_name, module_name)
+            return result
 
     def fake_loaded_module_data(
         self,
@@ -140,18 +191,29 @@ class TestImportsWorker(ContextDecorator):
 
         if loaded_module.__spec__ and loaded_module.__spec__.parent:
             loaded_parent = sys.modules[loaded_module.__spec__.parent]
-            module_name = loaded_module.__name__.rpartition(".")[-1]
+            module_name = self._split_name(loaded_module.__name__)[1]
             if attrib_value is _UNDEF:
                 delattr(loaded_parent, module_name)
             else:
                 setattr(loaded_parent, module_name, attrib_value)
 
-        fake_parent_name, _, fake_module_name = name.rpartition(".")
+        fake_parent_name, fake_module_name = self._split_name(name)
 
         if fake_parent_name:
-            fake_parent_module = self.wrapper_find_and_load(
-                fake_parent_name, import_,
-            )
+            # The parent is usually loaded already, in which case it only needs
+            # to be imported again if this worker treats it specially.
+            fake_parent_module = sys.modules.get(fake_parent_name)
+            if (
+                fake_parent_module is None
+                or self.sub_module_reload
+                or self._state is None
+                or self._state.is_hidden(fake_parent_name)
+                or self.is_fail_match(fake_parent_name)
+                or self.get_sub_match(fake_parent_name) != fake_parent_name
+            ):
+                fake_parent_module = self.wrapper_find_and_load(
+                    fake_parent_name, import_,
+                )
             setattr(fake_parent_module, fake_module_name, loaded_module)
         loaded_module.__name__ = fake_module_name
         if loaded_module.__spec__:
@@ -192,11 +254,17 @@ class TestImportsWorker(ContextDecorator):
             `from module import fromlist` that match the fail-module criteria
             from the constructor.
         """
-        return (
-            name
-            for name in self.expand_fromlist(module, fromlist)
-            if self.is_fail_match(name)
-        )
+        is_fail_match = self.is_fail_match
+        module_name = module.__name__
+        for name in fromlist:
+            if name == "*":
+                for full_name in self.expand_fromlist(module, ("*",)):
+                    if is_fail_match(full_name):
+                        yield full_name
+            else:
+                full_name = f"{module_name}.{name}"
+                if is_fail_match(full_name):
+                    yield full_name
 
     def get_attrib(self, name: str, import_: T_import) -> object:
         """
@@ -212,9 +280,10 @@ class TestImportsWorker(ContextDecorator):
         """
         if self._state is None:
             raise TestImportsUnpatchedError("not patched")  # pragma: no cover
-        parent_name, _, module_name = name.rpartition(".")
+        parent_name, module_name = self._split_name(name)
         if parent_name:
             module = self._state.original_find_and_load(parent_name, import_)
+            self._state.track_module(parent_name)
             return getattr(module, module_name, _UNDEF)
         else:
             return _UNDEF
@@ -225,39 +294,102 @@ class TestImportsWorker(ContextDecorator):
         """
         Patch for :py:func:`importlib._bootstrap._find_and_load`.
         """
-        self._debug(
-            f"{type(self).__name__}.wrapper_find_and_load("
-            f"{name!r}, {import_!r})",
-        )
+        if self.debug:
+            self._debug(
+                "%s.wrapper_find_and_load(%r, %r)",
+                type(self).__name__, name, import_,
+            )
 
-        if self._state is None:
-            raise TestImportsUnpatchedError("not patched")  # pragma: no cover
         if self.is_fail_match(name):
-            raise_exception(self.fail_exception, name)
+            raise self._make_fail_exception(name)
+        return self._find_and_load(name, import_)
+
+    def _find_and_load(self, name: str, import_: T_import) -> ModuleType:
+        """
+        Load module `name` (or its substitute), without failing it.
+
+        This is the part of :py:meth:`wrapper_find_and_load` shared with the
+        specialized patches (see :py:meth:`_make_find_and_load`).
+        """
+        state = self._state
+        if state is None:
+            raise TestImportsUnpatchedError("not patched")  # pragma: no cover
+
+        # Hot path (every import goes through here), so bind the lookups.
+        modules = sys.modules
+        is_hidden = state.is_hidden
+
+        if not (self._has_subs or self.sub_module_reload):
+            # Fast path for already loaded modules, same as the one in
+            # `_find_and_load` itself. Hidden modules are excluded because
+            # they get reloaded on each import.
+            module = modules.get(name)
+            if module is not None and not is_hidden(name):
+                spec = getattr(module, "__spec__", None)
+                if spec is None or not getattr(spec, "_initializing", False):
+                    return module
 
         name_to_load = self.get_sub_match(name)
         attrib_value = _UNDEF
         if name != name_to_load:
             attrib_value = self.get_attrib(name_to_load, import_)
-        modules_value = sys.modules.get(name_to_load, _UNDEF)
 
-        existing_module: ModuleType | None = None
-        if self.sub_module_reload or self._state.is_hidden(name_to_load):
-            existing_module = sys.modules.pop(name_to_load, None)
+        # Reloaded and hidden modules are taken out of `sys.modules` for the
+        # duration of loading, others are just remembered. Either way, the
+        # original value of `sys.modules[name_to_load]` (if any) is put back
+        # afterwards, and the loaded module is then registered under `name`
+        # by `fake_loaded_module_data`.
+        if self.sub_module_reload or is_hidden(name_to_load):
+            modules_value = modules.pop(name_to_load, _UNDEF)
+        else:
+            modules_value = modules.get(name_to_load, _UNDEF)
 
-        result = self._state.original_find_and_load(name_to_load, import_)
+        result = state.original_find_and_load(name_to_load, import_)
+        state.track_module(name_to_load)
+        if name != name_to_load:
+            state.track_module(name)
 
-        if existing_module is not None:
-            sys.modules[name_to_load] = existing_module
         if modules_value is _UNDEF:
-            sys.modules.pop(name_to_load, None)
+            modules.pop(name_to_load, None)
         elif isinstance(modules_value, ModuleType):
-            sys.modules[name_to_load] = modules_value
+            modules[name_to_load] = modules_value
 
         self.fake_loaded_module_data(result, name, attrib_value, import_)
 
         return result
 
+    def _make_find_and_load(self) -> T_find_and_load:
+        """
+        Return patch for `_find_and_load` specialized for this worker's rules.
+
+        Workers that only fail imports (the ones from
+        :py:func:`.interfaces.fail_imports`) get a function that checks the
+        merged fail regex directly and skips the substitution machinery. All
+        other workers get the generic :py:meth:`wrapper_find_and_load`.
+        """
+        if self._has_subs or self.sub_module_reload or self._fail_re is None:
+            return self.wrapper_find_and_load
+
+        fail_match = self._fail_re.match
+        make_fail_exception = self._make_fail_exception
+        find_and_load = self._find_and_load
+
+        @wraps(self.wrapper_find_and_load)
+        def wrapper_find_and_load(name: str, import_: T_import) -> ModuleType:
+            """
+            Patch for :py:func:`importlib._bootstrap._find_and_load`.
+            """
+            if self.debug:
+                self._debug(
+                    "%s.wrapper_find_and_load(%r, %r)",
+                    type(self).__name__, name, import_,
+                )
+            if fail_match(name) is not None:
+                raise make_fail_exception(name)
+            return find_and_load(name, import_)
+
+        return wrapper_find_and_load
+
     def wrapper_handle_fromlist(
         self,
         module: ModuleType,
@@ -269,21 +401,25 @@ class TestImportsWorker(ContextDecorator):
         """
         Patch for :py:func:`importlib._bootstrap._handle_fromlist`.
         """
-        self._debug(
-            f"{type(self).__name__}.wrapper_handle_fromlist("
-            f"{module!r}, {fromlist!r}, {import_!r}, recursive={recursive})",
-        )
-        if self._state is None:
+        if self.debug:
+            self._debug(
+                "%s.wrapper_handle_fromlist(%r, %r, %r, recursive=%s)",
+                type(self).__name__, module, fromlist, import_, recursive,
+            )
+        state = self._state
+        if state is None:
             raise TestImportsUnpatchedError("not patched")  # pragma: no cover
+        original_handle_fromlist = state.original_handle_fromlist
 
-        try:
-            name = next(self.get_fromlist_matches(module, fromlist))
-        except StopIteration:
-            pass
-        else:
-            raise_exception(self.fail_exception, name)
+        if not self.fail_modules:
+            return original_handle_fromlist(
+                module, fromlist, import_, recursive=recursive,
+            )
+
+        for name in self.get_fromlist_matches(module, fromlist):
+            raise self._make_fail_exception(name)
 
-        return self._state.original_handle_fromlist(
+        return original_handle_fromlist(
             module, fromlist, import_, recursive=recursive,
         )
 
@@ -299,11 +435,11 @@ class TestImportsWorker(ContextDecorator):
         )
         if self._state is None:
             self._state = BootstrapStates.patch(
-                self.wrapper_find_and_load,
+                self._make_find_and_load(),
                 self.wrapper_handle_fromlist,
                 hide_modules,
             )
-            self._debug(repr(self._state))
+            self._debug("%r", self._state)
             return True
         else:
             if strict:
@@ -328,6 +464,36 @@ class TestImportsWorker(ContextDecorator):
             self._state = None
             return True
 
+    def _clone(self) -> Self:
+        """
+        Return a non-patched shallow copy of this worker.
+
+        The normalized and compiled rules are never changed after the
+        construction, so the copy shares them instead of recreating them.
+        """
+        result = copy.copy(self)
+        result._state = None
+        return result
+
+    def __call__(self, func: Callable[P, R]) -> Callable[P, R]:
+        """
+        Enable the use of this class as a decorator.
+
+        Each call of the decorated function is patched by its own copy of this
+        worker (see :py:meth:`_clone`), so the decorated function can also be
+        called recursively.
+        """
+        @wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            worker = self._clone()
+            worker.patch()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                worker.unpatch()
+
+        return wrapper
+
     def __enter__(self) -> Self:
         """
         Enable the use of this class as a context manager.
@@ -1,35 +1,97 @@
-import io
+import importlib
+import importlib.machinery
 import os
 import re
 import sys
-import unittest.mock
+import types
+from typing import Any, Callable, Pattern, TypeVar
 
 from test_imports import (
-    fail_imports, TestImportsWorker, TestImportsPatchedError,
+    fail_imports, BootstrapStates, TestImportsWorker, TestImportsPatchedError,
     TestImportsUnpatchedError,
 )
-from test_imports.states import BootstrapStates
 
-from .utils import TestsBase
+from .utils import TestsBase, capture_stdout, drop_modules, ensure_loaded
+
+
+T = TypeVar("T", bound=Callable[..., Any])
 
 
 class TestException(Exception):
     pass
 
 
+def fails_import(test: T) -> T:
+    """
+    Mark `test` to be run with `fail_imports` entered in `setUp`.
+
+    The patch fails `TestFailImports._name_pat` with `TestFailImports.kwargs`
+    and it is applied after `sys.modules` is cleared of the test modules.
+    """
+    test._fails_import = True  # type: ignore[attr-defined]
+    return test
+
+
 class TestFailImports(TestsBase):
 
-    # Set `debug` to `True` if you need help fixing tests or just tracing what
-    # is happening.
-    kwargs = {
-        "exception": TestException,
-        "debug": False,
-        "hide_modules": ("tests.module*",),
-    }
+    _name_pat: Pattern
+    _hide_pats: tuple[Pattern, ...]
+    kwargs: dict[str, Any]
+    _debug_bootstrap_re: Pattern
+    _debug_import_expected: str
+    _debug_fromlist_re: Pattern
+    _fi: TestImportsWorker | None
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        # Precompiled patterns skip name normalization on each `fail_imports`.
+        cls._name_pat = re.compile(r"tests\.module1$")
+        cls._hide_pats = (re.compile(r"tests\.module.*$"),)
+        # Set `debug` to `True` if you need help fixing tests or just tracing
+        # what is happening.
+        cls.kwargs = {
+            "exception": TestException,
+            "debug": False,
+            "hide_modules": cls._hide_pats,
+        }
+        # Expected debugging outputs. The regexes are anchored with `\A`
+        # because `assertRegex` searches instead of matching.
+        cls._debug_bootstrap_re = re.compile(
+            r"\ADEBUG: BootstrapState\(<function"
+            r" TestImportsWorker\.wrapper_find_and_load at 0x[0-9a-f]+>,"
+            r" <bound method TestImportsWorker\.wrapper_handle_fromlist of"
+            r" <test_imports\.worker\.TestImportsWorker object at"
+            r" 0x[0-9a-f]+>>\)\n"
+        )
+        cls._debug_import_expected = (
+            "DEBUG: TestImportsWorker.wrapper_find_and_load("
+            "'tests.module1', <built-in function __import__>)\n"
+        )
+        cls._debug_fromlist_re = re.compile(
+            r"\ADEBUG: TestImportsWorker\.wrapper_handle_fromlist\(<module"
+            r" 'tests' from '.*?" + re.escape(os.sep) + r"__init__\.py'>,"
+            r" \('module1',\), <built-in function __import__>,"
+            r" recursive=False\)\n"
+        )
+
+    def setUp(self) -> None:
+        super().setUp()
+        self._fi = None
+        test = getattr(self, self._testMethodName)
+        if getattr(test, "_fails_import", False):
+            self._fi = fail_imports(self._name_pat, **self.kwargs)
+            self._fi.__enter__()
+
+    def tearDown(self) -> None:
+        if self._fi is not None:
+            self._fi.__exit__(None, None, None)
+            self._fi = None
+        super().tearDown()
 
     def test_context_manager(self) -> None:
-        import tests.module1
-        with fail_imports("tests.module1", **self.kwargs):
+        ensure_loaded("tests.module1")
+        with fail_imports(self._name_pat, **self.kwargs):
             with self.assertRaises(TestException):
                 import tests.module1  # noqa: W0611
 
@@ -37,11 +99,12 @@ class TestFailImports(TestsBase):
         # hide_modules should be a sequence of strings, but it's an easy enough
         # mistake to make it a string, so we try to account for that.
         import math  # noqa: W0611
-        self.assertTrue("math" in sys.modules)
+        modules = sys.modules
+        self.assertIn("math", modules)
         with fail_imports("tests.module1", hide_modules="tests.module*"):
             # Without treating this right, we'd hide `["t", "e",..., "*"]` and
             # this would've hidden `math`.
-            self.assertTrue("math" in sys.modules)
+            self.assertIn("math", modules)
 
     def test_context_manager_no_names(self) -> None:
         with self.assertRaises(ValueError):
@@ -54,7 +117,7 @@ class TestFailImports(TestsBase):
                 pass
 
     def test_context_manager_regex(self) -> None:
-        import tests.module1
+        ensure_loaded("tests.module1")
         with fail_imports(re.compile(r"tests\.module\d$"), **self.kwargs):
             with self.assertRaises(TestException):
                 import tests.module1  # noqa: W0611
@@ -64,48 +127,45 @@ class TestFailImports(TestsBase):
                 import tests.module3  # noqa: W0611
 
     def test_context_manager_from(self) -> None:
-        from . import module1
-        with fail_imports("tests.module1", **self.kwargs):
+        ensure_loaded("tests.module1")
+        with fail_imports(self._name_pat, **self.kwargs):
             with self.assertRaises(TestException):
                 from . import module1  # noqa: W0611
 
+    @fails_import
     def test_context_manager_nosys(self) -> None:
-        sys.modules.pop("tests.module1", None)
-        with fail_imports("tests.module1", **self.kwargs):
-            with self.assertRaises(TestException):
-                import tests.module1  # noqa: W0611
+        with self.assertRaises(TestException):
+            import tests.module1  # noqa: W0611
 
+    @fails_import
     def test_context_manager_nosys_from(self) -> None:
-        sys.modules.pop("tests.module1", None)
-        with fail_imports("tests.module1", **self.kwargs):
-            with self.assertRaises(TestException):
-                from . import module1  # noqa: W0611
+        with self.assertRaises(TestException):
+            from . import module1  # noqa: W0611
 
+    @fails_import
     def test_context_manager_nosys_from_all(self) -> None:
-        sys.modules.pop("tests.module1", None)
-        with fail_imports("tests.module1", **self.kwargs):
-            with self.assertRaises(TestException):
-                from . import module2  # noqa: W0611
+        with self.assertRaises(TestException):
+            from . import module2  # noqa: W0611
 
+    @fails_import
     def test_context_manager_submodule_from1(self) -> None:
-        with fail_imports("tests.module1", **self.kwargs):
-            with self.assertRaises(TestException):
-                from .module2 import module1  # noqa: W0611
+        with self.assertRaises(TestException):
+            from .module2 import module1  # noqa: W0611
 
     def test_context_manager_submodule_from2(self) -> None:
-        sys.modules.pop("tests.module1", None)
+        drop_modules("tests.module1")
         from .module2 import module1  # noqa: W0611
-        with fail_imports("tests.module1", **self.kwargs):
+        with fail_imports(self._name_pat, **self.kwargs):
             with self.assertRaises(TestException):
                 from .module2 import module1  # noqa: W0611
 
+    @fails_import
     def test_context_manager_submodule_star(self) -> None:
-        with fail_imports("tests.module1", **self.kwargs):
-            with self.assertRaises(TestException):
-                import tests.module3  # noqa: W0611
+        with self.assertRaises(TestException):
+            import tests.module3  # noqa: W0611
 
     def test_context_manager_submodule_all(self) -> None:
-        with fail_imports("tests.module1", **self.kwargs):
+        with fail_imports(self._name_pat, **self.kwargs):
             with self.assertRaises(TestException):
                 import tests.module4  # noqa: W0611
         with fail_imports("tests.module2", **self.kwargs):
@@ -113,7 +173,7 @@ class TestFailImports(TestsBase):
                 import tests.module4  # noqa: W0611
 
     def test_context_manager_submodule_func(self) -> None:
-        with fail_imports("tests.module1", **self.kwargs):
+        with fail_imports(self._name_pat, **self.kwargs):
             import tests.module5
             with self.assertRaises(TestException):
                 tests.module5.f()
@@ -130,65 +190,121 @@ class TestFailImports(TestsBase):
             with self.assertRaises(TestException):
                 import os.path  # noqa: W0611
 
+    def test_loaded_module_fast_path(self) -> None:
+        # Loaded modules that this worker doesn't hide are returned without
+        # calling the original `_find_and_load`.
+        import string
+        ensure_loaded("tests.module5")
+        calls: list[str] = list()
+        with fail_imports(self._name_pat, **self.kwargs) as fi:
+            state = fi._state
+            assert state is not None
+            original_find_and_load = state.original_find_and_load
+
+            def find_and_load(name: str, import_: Any) -> types.ModuleType:
+                calls.append(name)
+                return original_find_and_load(name, import_)
+
+            state.original_find_and_load = find_and_load
+            self.assertIs(importlib.import_module("string"), string)
+            self.assertEqual(calls, [])
+
+            # Hidden modules are loaded again on each import.
+            module5 = importlib.import_module("tests.module5")
+            self.assertIsNot(importlib.import_module("tests.module5"), module5)
+            self.assertEqual(calls, ["tests.module5", "tests.module5"])
+
+            # So are the modules that are still being initialized.
+            calls.clear()
+            name = "tests_initializing"
+            module = types.ModuleType(name)
+            module.__spec__ = importlib.machinery.ModuleSpec(name, None)
+            module.__spec__._initializing = True  # type: ignore[attr-defined]
+            sys.modules[name] = module
+            try:
+                self.assertIs(importlib.import_module(name), module)
+            finally:
+                drop_modules(name)
+            self.assertEqual(calls, [name])
+
+    def test_expand_fromlist_star(self) -> None:
+        module = types.ModuleType("fake")
+        module.foo = 1  # type: ignore[attr-defined]
+        with fail_imports(self._name_pat, **self.kwargs) as fi:
+            # The names come from the module as it is at the time of the
+            # import, so the changes to its namespace and `__all__` show up.
+            self.assertEqual(
+                list(fi.expand_fromlist(module, ["*", "baz"])),
+                ["fake.foo", "fake.baz"],
+            )
+            module.bar = 2  # type: ignore[attr-defined]
+            self.assertEqual(
+                list(fi.expand_fromlist(module, ["*"])),
+                ["fake.bar", "fake.foo"],
+            )
+            del module.foo  # type: ignore[attr-defined]
+            module.baz = 3  # type: ignore[attr-defined]
+            self.assertEqual(
+                list(fi.expand_fromlist(module, ["*"])),
+                ["fake.bar", "fake.baz"],
+            )
+            module.__all__ = ["foo"]  # type: ignore[attr-defined]
+            self.assertEqual(
+                list(fi.expand_fromlist(module, ["*"])), ["fake.foo"],
+            )
+            module.__all__[0] = "bar"
+            self.assertEqual(
+                list(fi.expand_fromlist(module, ["*"])), ["fake.bar"],
+            )
+
     def test_decorator(self) -> None:
-        @fail_imports("tests.module1", **self.kwargs)
+        @fail_imports(self._name_pat, **self.kwargs)
         def f() -> None:
             import tests.module1  # noqa: W0611
 
-        import tests.module1  # noqa: W0611
+        ensure_loaded("tests.module1")
         with self.assertRaises(TestException):
             f()
 
+    def test_decorator_recursive(self) -> None:
+        @fail_imports(self._name_pat, **self.kwargs)
+        def f(depth: int) -> None:
+            if depth:
+                f(depth - 1)
+            else:
+                import tests.module1  # noqa: W0611
+
+        with self.assertRaises(TestException):
+            f(2)
+
     def test_context_manager_debug(self) -> None:
         kwargs = dict(**self.kwargs)
         kwargs["debug"] = True
-        regex = (
-            r"DEBUG: BootstrapState\(<bound method"
-            r" TestImportsWorker.wrapper_find_and_load of"
-            r" <test_imports.worker.TestImportsWorker object at 0x[0-9a-f]+>>,"
-            r" <bound method TestImportsWorker.wrapper_handle_fromlist of"
-            r" <test_imports.worker.TestImportsWorker object at"
-            r" 0x[0-9a-f]+>>\)" + "\n"
-        )
-
-        with unittest.mock.patch(
-            "sys.stdout", new_callable=io.StringIO,
-        ) as mock_stdout:
-            with fail_imports("tests.module1", **kwargs):
+        with capture_stdout() as mock_stdout:
+            with fail_imports(self._name_pat, **kwargs):
                 pass
 
-        self.assertTrue(re.match(regex, mock_stdout.getvalue()))
+        self.assertRegex(mock_stdout.getvalue(), self._debug_bootstrap_re)
 
         kwargs["debug"] = False
 
-        with unittest.mock.patch(
-            "sys.stdout", new_callable=io.StringIO,
-        ) as mock_stdout:
-            with fail_imports("tests.module1", **kwargs):
+        with capture_stdout() as mock_stdout:
+            with fail_imports(self._name_pat, **kwargs):
                 pass
 
         self.assertEqual(mock_stdout.getvalue(), "")
 
     def test_context_manager_debug_import(self) -> None:
-        expected = (
-            "DEBUG: TestImportsWorker.wrapper_find_and_load("
-            "'tests.module1', <built-in function __import__>)\n"
-        )
-
-        with fail_imports("tests.module1", **self.kwargs) as fi:
-            with unittest.mock.patch(
-                "sys.stdout", new_callable=io.StringIO,
-            ) as mock_stdout:
+        with fail_imports(self._name_pat, **self.kwargs) as fi:
+            with capture_stdout() as mock_stdout:
                 fi.debug = True
                 with self.assertRaises(TestException):
                     import tests.module1  # noqa: W0611
 
-        self.assertEqual(mock_stdout.getvalue(), expected)
+        self.assertEqual(mock_stdout.getvalue(), self._debug_import_expected)
 
-        with fail_imports("tests.module1", **self.kwargs) as fi:
-            with unittest.mock.patch(
-                "sys.stdout", new_callable=io.StringIO,
-            ) as mock_stdout:
+        with fail_imports(self._name_pat, **self.kwargs) as fi:
+            with capture_stdout() as mock_stdout:
                 fi.debug = False
                 with self.assertRaises(TestException):
                     import tests.module1  # noqa: W0611
@@ -196,27 +312,16 @@ class TestFailImports(TestsBase):
         self.assertEqual(mock_stdout.getvalue(), "")
 
     def test_context_manager_debug_from_import(self) -> None:
-        regex = (
-            r"DEBUG: TestImportsWorker.wrapper_handle_fromlist\(<module"
-            r" 'tests' from '.*?" + os.sep + r"__init__.py'>,"
-            r" \('module1',\), <built-in function __import__>,"
-            r" recursive=False\)" + "\n"
-        )
-
-        with fail_imports("tests.module1", **self.kwargs) as fi:
-            with unittest.mock.patch(
-                "sys.stdout", new_callable=io.StringIO,
-            ) as mock_stdout:
+        with fail_imports(self._name_pat, **self.kwargs) as fi:
+            with capture_stdout() as mock_stdout:
                 fi.debug = True
                 with self.assertRaises(TestException):
                     from tests import module1  # noqa: W0611
 
-        self.assertTrue(re.match(regex, mock_stdout.getvalue()))
+        self.assertRegex(mock_stdout.getvalue(), self._debug_fromlist_re)
 
-        with fail_imports("tests.module1", **self.kwargs) as fi:
-            with unittest.mock.patch(
-                "sys.stdout", new_callable=io.StringIO,
-            ) as mock_stdout:
+        with fail_imports(self._name_pat, **self.kwargs) as fi:
+            with capture_stdout() as mock_stdout:
                 fi.debug = False
                 with self.assertRaises(TestException):
                     from tests import module1  # noqa: W0611
@@ -224,7 +329,7 @@ class TestFailImports(TestsBase):
         self.assertEqual(mock_stdout.getvalue(), "")
 
     def test_patch(self) -> None:
-        fi = fail_imports("tests.module1", **self.kwargs)
+        fi = fail_imports(self._name_pat, **self.kwargs)
         self.assertTrue(fi.patch())
         self.assertFalse(fi.patch(strict=False))
         with self.assertRaises(TestImportsPatchedError):
@@ -233,7 +338,7 @@ class TestFailImports(TestsBase):
         BootstrapStates.clear()
 
     def test_unpatch(self) -> None:
-        fi = fail_imports("tests.module1", **self.kwargs)
+        fi = fail_imports(self._name_pat, **self.kwargs)
         fi.patch()
         self.assertTrue(fi.unpatch())
         self.assertFalse(fi.unpatch(strict=False))
@@ -251,27 +356,27 @@ class TestFailImports(TestsBase):
         # Check that the matching modules loaded during the session (not
         # before!) still get removed from `sys.modules` when the session is
         # over.
-        sys.modules.pop("tests.module1", None)
-        sys.modules.pop("tests.module5", None)
-        with fail_imports("tests.module1", **self.kwargs):
+        drop_modules("tests.module1", "tests.module5")
+        modules = sys.modules
+        with fail_imports(self._name_pat, **self.kwargs):
             import tests.module5  # noqa: W0611
             with self.assertRaises(TestException):
                 import tests.module1  # noqa: W0611
-            self.assertTrue("tests.module5" in sys.modules)
-        self.assertTrue("tests.module5" not in sys.modules)
+            self.assertIn("tests.module5", modules)
+        self.assertNotIn("tests.module5", modules)
 
     def test_modules_nonremoval(self) -> None:
         # Check that the matching modules loaded during before the session do
         # not get removed from `sys.modules` when the session is over, even
         # though they are removed during the session (when in `hide_modules`
         # argument).
-        sys.modules.pop("tests.module1", None)
-        sys.modules.pop("tests.module5", None)
+        drop_modules("tests.module1", "tests.module5")
+        modules = sys.modules
         import tests.module5  # noqa: W0611
-        self.assertTrue("tests.module5" in sys.modules)
-        with fail_imports("tests.module1", **self.kwargs):
-            self.assertTrue("tests.module5" not in sys.modules)
+        self.assertIn("tests.module5", modules)
+        with fail_imports(self._name_pat, **self.kwargs):
+            self.assertNotIn("tests.module5", modules)
             with self.assertRaises(TestException):
                 import tests.module1  # noqa: W0611
-            self.assertTrue("tests.module5" not in sys.modules)
-        self.assertTrue("tests.module5" in sys.modules)
+            self.assertNotIn("tests.module5", modules)
+        self.assertIn("tests.module5", modules)
@@ -1,13 +1,32 @@
+import importlib._bootstrap  # type: ignore
+import re
 import sys
+from typing import Pattern
 
 from test_imports import mock_imports, TestImportsWorker
 
-from .utils import TestsBase
+from .utils import TestsBase, drop_modules, ensure_loaded
 
 
 class TestMockImports(TestsBase):
 
+    _sub_tests_module5: dict[Pattern, str]
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        # Prebuilt substitutions skip `mock_imports` keyword arguments parsing.
+        cls._sub_tests_module5 = {
+            re.compile(r"tests\.module5$"): "tests.module1",
+        }
+
     def test_mock_inside_package(self) -> None:
+        with TestImportsWorker(sub_modules=self._sub_tests_module5):
+            import tests.module5
+            self.assertEqual(tests.module5.FOO, 17)
+
+    def test_mock_with_loaded_substitute(self) -> None:
+        ensure_loaded("tests.module1")
         with mock_imports(tests__module5="tests.module1"):
             import tests.module5
             self.assertEqual(tests.module5.FOO, 17)
@@ -58,8 +77,7 @@ class TestMockImports(TestsBase):
                 delattr(sys.modules["html"], "parser")
             except Exception:
                 pass
-            sys.modules.pop("html", None)
-            sys.modules.pop("html.parser", None)
+            drop_modules("html", "html.parser")
 
         # Test the original import (i.e., legit `html.parser`).
         cleanup()
@@ -93,7 +111,7 @@ class TestMockImports(TestsBase):
 
         # And what if the attribute doesn't exist? It should keep not existing!
         delattr(html, "parser")
-        sys.modules.pop("html.parser", None)
+        drop_modules("html.parser")
 
         with mock_imports(math="html.parser"):
             import math
@@ -125,13 +143,55 @@ class TestMockImports(TestsBase):
             self.assertEqual(string.sin(0), 0)
 
     def test_fromlist(self) -> None:
-        sys.modules.pop("html.parser", None)
-        sys.modules.pop("html", None)
+        drop_modules("html.parser", "html")
         import math
         with mock_imports(html__parser="math", TI_reload=True):
             from html import parser
             self.assertEqual(parser.sin(0), math.sin(0))
 
+    def test_sub_with_unmergeable_regex(self) -> None:
+        # Regexes with groups are not merged, so they are matched one by one.
+        sub_modules = {
+            re.compile(r"(math)$"): "string",
+            re.compile(r"(tests)\.module5$"): "tests.module1",
+        }
+        with TestImportsWorker(sub_modules=sub_modules):
+            import tests.module5
+            self.assertEqual(tests.module5.FOO, 17)
+
+    def test_generic_patch(self) -> None:
+        # Substitutions are not specialized, so the method itself is used.
+        with mock_imports(math="string") as mi:
+            self.assertEqual(
+                importlib._bootstrap._find_and_load, mi.wrapper_find_and_load,
+            )
+
+    def test_unload_tracked_modules(self) -> None:
+        # Both the requested and the substituted names of the modules loaded
+        # during the session are removed when the session is over.
+        modules = sys.modules
+        with mock_imports(
+            tests__module5="tests.module1", TI_hide_modules=["tests.module*"],
+        ) as mi:
+            import tests.module5  # noqa: W0611
+            self.assertIn("tests.module5", modules)
+            state = mi._state
+            assert state is not None
+            self.assertIn("tests.module1", state._known_matching)
+        self.assertNotIn("tests.module5", modules)
+        self.assertNotIn("tests.module1", modules)
+
+    def test_unload_tracked_parent(self) -> None:
+        # The parent of the substitute is loaded separately, before the
+        # substitute itself, and is also removed if it matches.
+        drop_modules("html.parser", "html")
+        modules = sys.modules
+        with mock_imports(math="html.parser", TI_hide_modules=["html"]):
+            import math  # noqa: W0611
+            self.assertIn("html", modules)
+        self.assertNotIn("html", modules)
+        drop_modules("html.parser")
+
     def test_invalid_type(self) -> None:
         with self.assertRaises(TypeError):
             with TestImportsWorker(sub_modules=dict(math=object())):
@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+from typing import Any
+
+import test_imports
+
+from .utils import TestsBase
+
+
+class TestPackage(TestsBase):
+
+    def test_lazy_submodules(self) -> None:
+        # Run in a new interpreter, as the submodules are already loaded here.
+        code = (
+            "import sys\n"
+            "import test_imports\n"
+            "names = ('test_imports.interfaces', 'test_imports.states',"
+            " 'test_imports.worker')\n"
+            "print([name for name in names if name in sys.modules])\n"
+            "test_imports.fail_imports\n"
+            "print([name for name in names if name in sys.modules])\n"
+        )
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(path for path in sys.path if path)
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True, text=True, env=env, check=True,
+        )
+        self.assertEqual(
+            result.stdout.splitlines(),
+            [
+                "[]",
+                "['test_imports.interfaces', 'test_imports.states',"
+                " 'test_imports.worker']",
+            ],
+        )
+
+    def test_lazy_name_cached(self) -> None:
+        from test_imports.worker import TestImportsWorker
+        self.assertIs(test_imports.TestImportsWorker, TestImportsWorker)
+        self.assertIs(
+            vars(test_imports)["TestImportsWorker"], TestImportsWorker,
+        )
+
+    def test_star_import(self) -> None:
+        namespace: dict[str, Any] = dict()
+        exec("from test_imports import *", namespace)
+        for name in test_imports.__all__:
+            self.assertIs(namespace[name], getattr(test_imports, name))
+
+    def test_unknown_name(self) -> None:
+        with self.assertRaises(AttributeError):
+            test_imports.this_name_does_not_exist
+        with self.assertRaises(ImportError):
+            from test_imports import this_name_does_not_exist  # noqa: W0611
+
+    def test_dir(self) -> None:
+        names = dir(test_imports)
+        self.assertEqual(names, sorted(names))
+        for name in test_imports.__all__:
+            self.assertIn(name, names)
+        self.assertIn("__version__", names)
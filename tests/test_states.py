@@ -2,7 +2,9 @@
 # tests here only focus on fringe cases that don't occur much - if ever - in
 # the main code.
 
+import importlib._bootstrap  # type: ignore
 import re
+import threading
 
 from test_imports import (
     BootstrapState, BootstrapStates, TestImportsRevertError,
@@ -17,23 +19,114 @@ class TestException(Exception):
 
 class TestStates(TestsBase):
 
+    _FOO = re.compile("foo")
+    _BAR = re.compile("bar")
+    _BAZ = re.compile("baz")
+    _SOMEMOD = re.compile("some_module")
+
     def test_revert_inactive_state(self) -> None:
-        state = BootstrapState([re.compile("some_module")])
+        state = BootstrapState([self._SOMEMOD])
         state.revert()
         with self.assertRaises(TestImportsRevertError):
             state.revert()
 
+    def test_state_has_no_dict(self) -> None:
+        state = BootstrapState([self._SOMEMOD])
+        self.assertFalse(hasattr(state, "__dict__"))
+        with self.assertRaises(AttributeError):
+            state.some_attribute = None  # type: ignore[attr-defined]
+        state.revert()
+
+    def test_unpatch_nested_state(self) -> None:
+        noop = importlib._bootstrap._find_and_load
+        noop_fromlist = importlib._bootstrap._handle_fromlist
+        states = [
+            BootstrapStates.patch(noop, noop_fromlist, [regex])
+            for regex in (self._FOO, self._BAR, self._BAZ)
+        ]
+
+        # Unpatching a state also unpatches all the states after it.
+        BootstrapStates.unpatch(states[1])
+        self.assertEqual(BootstrapStates._states, states[:1])
+        self.assertFalse(states[1]._active)
+        self.assertFalse(states[2]._active)
+
+        BootstrapStates.unpatch(states[0])
+        self.assertEqual(BootstrapStates._states, [])
+        self.assertEqual(BootstrapStates._state_positions, {})
+
+    def test_nested_locking(self) -> None:
+        # Patching and unpatching can happen while the lock is already held by
+        # the same thread (e.g., when a worker is garbage-collected during
+        # `BootstrapStates.clear`), so it must not deadlock. It's run in a
+        # thread, so that a deadlock fails the test instead of hanging it.
+        noop = importlib._bootstrap._find_and_load
+        noop_fromlist = importlib._bootstrap._handle_fromlist
+
+        def nested() -> None:
+            with BootstrapStates._lock:
+                state = BootstrapStates.patch(noop, noop_fromlist, [self._FOO])
+                with BootstrapStates._lock:
+                    BootstrapStates.unpatch(state)
+                BootstrapStates.patch(noop, noop_fromlist, [self._BAR])
+                BootstrapStates.clear()
+
+        thread = threading.Thread(target=nested, daemon=True)
+        thread.start()
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive(), "deadlock")
+        self.assertEqual(BootstrapStates._states, [])
+        self.assertEqual(BootstrapStates._state_positions, {})
+
+    def test_concurrent_patching(self) -> None:
+        # Each thread unpatches its own states, which also unpatches the newer
+        # ones of the other threads, so the stack must be consistent at all
+        # times and empty at the end.
+        noop = importlib._bootstrap._find_and_load
+        noop_fromlist = importlib._bootstrap._handle_fromlist
+        errors: list[str] = list()
+
+        def check_stack() -> None:
+            with BootstrapStates._lock:
+                states = BootstrapStates._states
+                positions = BootstrapStates._state_positions
+                if positions != {
+                    id(state): index for index, state in enumerate(states)
+                }:
+                    errors.append("inconsistent positions")
+                if not all(state._active for state in states):
+                    errors.append("inactive state on the stack")
+
+        def work(regex: re.Pattern) -> None:
+            for _ in range(200):
+                state = BootstrapStates.patch(noop, noop_fromlist, [regex])
+                check_stack()
+                BootstrapStates.unpatch(state)
+                check_stack()
+
+        threads = [
+            threading.Thread(target=work, args=(regex,), daemon=True)
+            for regex in (self._FOO, self._BAR, self._BAZ)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+            self.assertFalse(thread.is_alive(), "deadlock")
+        self.assertEqual(errors, [])
+        self.assertEqual(BootstrapStates._states, [])
+        self.assertEqual(BootstrapStates._state_positions, {})
+
     def test_unpatch_nonexistent_state(self) -> None:
-        foo_state = BootstrapState([re.compile("foo")])
-        BootstrapStates._states.append(foo_state)
-
-        # Try to unpatch a state that does not exist. This should fail silently
-        # because the state may have been legitimately reverted if another,
-        # older one, was already reverted manually.
-        BootstrapStates.unpatch(BootstrapState([re.compile("bar")]))
-
-        # Still only one state (so, nothing was unpatched).
-        self.assertTrue(len(BootstrapStates._states) == 1)
-        # And that one state is "foo".
-        self.assertTrue(BootstrapStates._states[0] is foo_state)
-        BootstrapStates._states.clear()
+        foo_state = BootstrapState([self._FOO])
+        with BootstrapStates._scoped_states([foo_state]):
+            # Try to unpatch a state that does not exist. This should fail
+            # silently because the state may have been legitimately reverted
+            # if another, older one, was already reverted manually.
+            BootstrapStates.unpatch(BootstrapState([self._BAR]))
+
+            # Still only one state (so, nothing was unpatched).
+            self.assertTrue(len(BootstrapStates._states) == 1)
+            # And that one state is "foo".
+            self.assertTrue(BootstrapStates._states[0] is foo_state)
+        self.assertEqual(BootstrapStates._states, [])
@@ -2,8 +2,9 @@ import re
 import string
 from typing import Pattern
 from test_imports.utils import (
-    check_exception, raise_exception, normalize_name, str_to_pattern,
-    pop_bool, pop_hide_modules, check_no_extra_kwargs, kwargs_to_sub_modules,
+    check_exception, raise_exception, get_exception_factory, normalize_name,
+    str_to_pattern, combine_patterns, pattern_to_literal, pop_bool,
+    pop_hide_modules, check_no_extra_kwargs, kwargs_to_sub_modules,
 )
 
 from .utils import TestsBase
@@ -15,6 +16,11 @@ class TestException(Exception):
 
 class TestUtils(TestsBase):
 
+    # A value that is neither `True` nor `False`, for checking the casting.
+    _SENTINEL = object()
+    # Keyword arguments that don't start with any prefix used in the tests.
+    _ASCII_KWARGS = {key: "" for key in string.ascii_letters}
+
     def test_check_exception(self) -> None:
         check_exception(TestException)
         check_exception(TestException())
@@ -37,6 +43,19 @@ class TestUtils(TestsBase):
         with self.assertRaises(TypeError):
             raise_exception(object())
 
+    def test_get_exception_factory(self) -> None:
+        exc = get_exception_factory(TestException)("foo")
+        self.assertTrue(isinstance(exc, TestException))
+        self.assertEqual(str(exc), "foo")
+        instance = TestException("bar")
+        self.assertTrue(get_exception_factory(instance)("foo") is instance)
+
+    def test_get_exception_factory_fail(self) -> None:
+        with self.assertRaises(TypeError):
+            get_exception_factory(object)
+        with self.assertRaises(TypeError):
+            get_exception_factory(object())
+
     def test_normalize_name_str(self) -> None:
         test_name = "nomen_est_omen"
         result = normalize_name(test_name)
@@ -73,15 +92,70 @@ class TestUtils(TestsBase):
         self.assertTrue(isinstance(result, Pattern))
         self.assertEqual(result.pattern, expected)
 
+    def test_pattern_to_literal(self) -> None:
+        for name in ("math", "tests.module1", "foo-bar", "a\\b"):
+            self.assertEqual(pattern_to_literal(normalize_name(name)), name)
+        self.assertEqual(
+            pattern_to_literal(re.compile(r"tests\.module1$")),
+            "tests.module1",
+        )
+
+    def test_pattern_to_literal_not_literal(self) -> None:
+        for pattern in (
+            normalize_name("tests.module*"),
+            re.compile("tests.module1$"),
+            re.compile(r"tests\.module1"),
+            re.compile(r"foo\$"),
+            re.compile(r"\d$"),
+            re.compile("$"),
+            re.compile("foo$", re.IGNORECASE),
+            re.compile(b"foo$"),
+        ):
+            self.assertIsNone(pattern_to_literal(pattern), repr(pattern))
+
+    def test_combine_patterns(self) -> None:
+        patterns = [
+            normalize_name("tests.module*"),
+            re.compile("foo", re.IGNORECASE),
+            re.compile(r"bar\d"),
+        ]
+        result = combine_patterns(patterns)
+        self.assertTrue(isinstance(result, Pattern))
+        for name in (
+            "tests.module1", "tests.module", "FOO", "foobar", "bar1", "bar",
+            "tests", "xfoo",
+        ):
+            self.assertEqual(
+                bool(result.match(name)),
+                any(regex.match(name) for regex in patterns),
+                f"name: {name!r}",
+            )
+
+    def test_combine_patterns_capture(self) -> None:
+        patterns = [re.compile("foo$"), re.compile("ba.$"), re.compile("bar")]
+        result = combine_patterns(patterns, capture=True)
+        self.assertEqual(result.match("foo").lastindex, 1)
+        # The first matching pattern wins.
+        self.assertEqual(result.match("bar").lastindex, 2)
+        self.assertEqual(result.match("barn").lastindex, 3)
+        self.assertIsNone(result.match("baz1"))
+
+    def test_combine_patterns_fail(self) -> None:
+        self.assertIsNone(combine_patterns([]))
+        self.assertIsNone(combine_patterns([re.compile(b"foo")]))
+        self.assertIsNone(combine_patterns([re.compile(r"(foo)\1")]))
+        self.assertIsNone(combine_patterns([re.compile("(?i)foo")]))
+        self.assertIsNone(combine_patterns([re.compile("foo", re.ASCII)]))
+
     def test_pop_bool(self) -> None:
-        for value in (True, False, object()):
+        for value in (True, False, self._SENTINEL):
             kwargs = {"nomen_est_omen": value, "foo": "bar"}
             result = pop_bool("nomen_est_omen", "", kwargs)
             self.assertEqual(result, bool(value), f"value: {value!r}")
             self.assertEqual(kwargs, {"foo": "bar"})
 
     def test_pop_bool_prefix(self) -> None:
-        for value in (True, False, object()):
+        for value in (True, False, self._SENTINEL):
             kwargs = {"pfx_nomen_est_omen": value, "foo": "bar"}
             result = pop_bool("nomen_est_omen", "pfx_", kwargs)
             self.assertEqual(result, bool(value), f"value: {value!r}")
@@ -113,7 +187,7 @@ class TestUtils(TestsBase):
             pop_hide_modules("", {"hide_modules": [object()]})
 
     def test_check_no_extra_kwargs(self) -> None:
-        kwargs = {key: "" for key in string.ascii_letters}
+        kwargs = self._ASCII_KWARGS.copy()
 
         # `s.startswith("")` is `True` for all strings, so make sure to not get
         # a false positive here.
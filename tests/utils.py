@@ -2,14 +2,85 @@
 Testing utilities.
 """
 
-import re
+from collections.abc import Iterator
+from contextlib import contextmanager, redirect_stdout
+import importlib
+from pathlib import Path
 import sys
+from types import ModuleType
+from typing import TextIO, cast
 
-from test_imports.states import BootstrapStates
+from test_imports import BootstrapStates
 
 import unittest
 
 
+# Names of all `tests.moduleN` modules, so that they can be removed from
+# `sys.modules` without scanning it.
+_TEST_MODULES = tuple(
+    f"tests.{path.stem}"
+    for path in sorted(Path(__file__).parent.glob("module*.py"))
+    if path.stem[len("module"):].isdigit()
+)
+
+
+def drop_modules(*names: str) -> None:
+    """
+    Remove modules `names` from `sys.modules` cache, if they are there.
+    """
+    modules = sys.modules
+    for name in names:
+        modules.pop(name, None)
+
+
+def ensure_loaded(name: str) -> ModuleType:
+    """
+    Return module `name`, importing it only if it's not loaded already.
+    """
+    module = sys.modules.get(name)
+    return module if module is not None else importlib.import_module(name)
+
+
+class _Lines:
+    """
+    Minimal text stream that only collects what is written to it.
+
+    The captured output is read just once, so the written strings are simply
+    appended to a list and joined in :py:meth:`getvalue`.
+    """
+
+    def __init__(self) -> None:
+        self._parts: list[str] = list()
+
+    def write(self, text: str) -> int:
+        """
+        Save `text` and return its length, as text streams do.
+        """
+        self._parts.append(text)
+        return len(text)
+
+    def getvalue(self) -> str:
+        """
+        Return everything written so far.
+        """
+        return "".join(self._parts)
+
+    def flush(self) -> None:
+        """
+        Do nothing, as there is no buffer to flush.
+        """
+
+
+@contextmanager
+def capture_stdout() -> Iterator[_Lines]:
+    """
+    Return context manager capturing standard output in a `_Lines` object.
+    """
+    buffer = _Lines()
+    with redirect_stdout(cast(TextIO, buffer)):
+        yield buffer
+
+
 class TestsBase(unittest.TestCase):
     """
     The base unit tests class, used as a foundation for all other unit tests.
@@ -19,11 +90,7 @@ class TestsBase(unittest.TestCase):
         """
         Clear all `tests.modules*` from `sys.modules` cache.
         """
-        test_modules = [
-            name for name in sys.modules if re.match(r"tests.module\d+$", name)
-        ]
-        for name in test_modules:
-            del sys.modules[name]
+        drop_modules(*_TEST_MODULES)
 
     def setUp(self) -> None:
         """
@@ -35,11 +102,10 @@ class TestsBase(unittest.TestCase):
         """
         Check that the worker cleaned up after itself.
         """
-        try:
-            self.assertFalse(
-                bool(BootstrapStates._states),
-                "States should be cleaned up after we're done with patching",
-            )
-        except Exception:
+        states_count = len(BootstrapStates._states)
+        if states_count:
             BootstrapStates.clear()
-            raise
+            self.fail(
+                "States should be cleaned up after we're done with patching"
+                f" ({states_count} remaining)",
+            )